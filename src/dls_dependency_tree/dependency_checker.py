@@ -1,15 +1,16 @@
 #!/bin/env dls-python3
 """Script to check the dependencies of a given module."""
+
+import codecs
 import os
 import signal
 import sys
 import traceback
 from argparse import ArgumentParser
-from subprocess import PIPE, Popen
 from typing import Optional
 
-from PyQt5.QtCore import QProcess, Qt
-from PyQt5.QtGui import QBrush, QColor, QFont, QPalette
+from PyQt5.QtCore import QProcess, Qt, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QBrush, QColor, QFont, QPalette, QTextCursor
 from PyQt5.QtWidgets import (
     QApplication,
     QDialog,
@@ -27,7 +28,7 @@ from PyQt5.QtWidgets import (
 from .dependency_checker_ui import Ui_Form1
 from .tree import dependency_tree
 from .tree_update import dependency_tree_update
-from .ioc_build import build_ioc
+from .ioc_build import prepare_build
 
 author = "Tom Cobb"
 usage = """
@@ -41,6 +42,14 @@ versions between the original and latest numbers, view SVN logs, and edit
 configure/RELEASE files directly. The updated trees can then be written to
 configure/RELEASE, or the changes printed on the commandline."""
 
+# brushes shared by every item in the GUI trees
+_BG_NORMAL = QBrush(QColor(212, 216, 236))  # normal - blue
+_BG_UPDATE = QBrush(QColor(203, 255, 197))  # update available - green
+_FG_NORMAL = QBrush(Qt.GlobalColor.black)
+_FG_CLASH = QBrush(QColor(153, 150, 0))  # involved in clash: yellow
+_FG_CAUSE = QBrush(Qt.GlobalColor.red)  # causes clash: red
+_FG_INVALID = QBrush(QColor(160, 32, 240))  # invalid: purple
+
 
 if __name__ == "__main__":
     sys.path.append(
@@ -52,54 +61,120 @@ if __name__ == "__main__":
     )
 
 
-def build_gui_tree(
-    list_view: "TreeView",
-    tree: dependency_tree,
-    parent: Optional[QTreeWidgetItem] = None,
-):
-    """Build GUI Tree.
+def gui_item_state(list_view: "TreeView", tree: dependency_tree):
+    """Return the foreground, background and open state for a module.
 
-    Function that takes a ListView or ListViewItem, and populates its
-    children from a dependency_tree.
+    The open state is True if the module's parents should be opened to
+    show it.
     """
-    if parent is None:
-        list_view.clear()
-    if parent:
-        child = QTreeWidgetItem(parent)
-    else:
-        child = QTreeWidgetItem(list_view)
-        list_view.child = child
-    child.setText(0, "%s: %s" % (tree.name, tree.version))
-    setattr(child, "tree", tree)
-    fg = QBrush(Qt.GlobalColor.black)
-    bg = QBrush(QColor(212, 216, 236))  # normal - blue
+    fg = _FG_NORMAL
+    bg = _BG_NORMAL
     open_parents = False
     if len(tree.updates()) > 1:
-        bg = QBrush(QColor(203, 255, 197))  # update available - green
+        bg = _BG_UPDATE
         open_parents = True
-    if tree.name in list(list_view.clashes.keys()):
+    if tree.name in list_view.clash_winner:
         open_parents = True
-        if (
-            tree.path
-            == tree.e.sortReleases([x.path for x in list_view.clashes[tree.name]])[-1]
-        ):
-            fg = QBrush(QColor(153, 150, 0))  # involved in clash: yellow
+        if tree.path == list_view.clash_winner[tree.name]:
+            fg = _FG_CLASH
         else:
-            fg = QBrush(Qt.GlobalColor.red)  # causes clash: red
+            fg = _FG_CAUSE
     if tree.version == "invalid":
         open_parents = True
-        fg = QBrush(QColor(160, 32, 240))  # invalid: purple
-    child.setForeground(0, fg)
-    child.setBackground(0, bg)
-    if open_parents:
-        temp_ob = child
-        while temp_ob.parent():
-            temp_ob.parent().setExpanded(True)
-            temp_ob = temp_ob.parent()
-    for leaf in tree.leaves:
-        build_gui_tree(list_view, leaf, child)
+        fg = _FG_INVALID
+    return fg, bg, open_parents
+
+
+def color_gui_item(list_view: "TreeView", item: QTreeWidgetItem) -> None:
+    """Colour a GUI tree item according to the state of its module."""
+    fg, bg, _ = gui_item_state(list_view, item.tree)
+    item.setForeground(0, fg)
+    item.setBackground(0, bg)
+
+
+def new_gui_item(list_view: "TreeView", tree: dependency_tree) -> QTreeWidgetItem:
+    """Make a coloured GUI tree item for a single module, not yet attached."""
+    # pass the text to the constructor rather than calling setText after
+    child = QTreeWidgetItem([f"{tree.name}: {tree.version}"])
+    list_view.item_for[id(tree)] = child
+    setattr(child, "tree", tree)
+    setattr(child, "populated", False)
+    color_gui_item(list_view, child)
+    return child
+
+
+def make_gui_item(
+    list_view: "TreeView",
+    tree: dependency_tree,
+    parent: Optional[QTreeWidgetItem] = None,
+    index: Optional[int] = None,
+) -> QTreeWidgetItem:
+    """Make a coloured GUI tree item for a single module.
+
+    If index is given, the item is inserted at that position under parent
+    rather than appended.
+    """
+    child = new_gui_item(list_view, tree)
+    if parent and index is not None:
+        parent.insertChild(index, child)
+    elif parent:
+        parent.addChild(child)
+    else:
+        list_view.addTopLevelItem(child)
+        list_view.child = child
+    return child
+
+
+def build_gui_tree(
+    list_view: "TreeView",
+    tree: dependency_tree,
+    parent: Optional[QTreeWidgetItem] = None,
+    index: Optional[int] = None,
+) -> None:
+    """Build GUI Tree.
+
+    Function that takes a ListView or ListViewItem, and populates its
+    children from a dependency_tree. If index is given, the new item is
+    inserted at that position under parent rather than appended. Children
+    of items that do not need opening are only built when first expanded.
+    """
     if parent is None:
-        child.setExpanded(True)
+        list_view.clear()
+        list_view.item_for = {}
+    child = make_gui_item(list_view, tree, parent, index)
+    if parent is None or list_view.subtree_needs_open(tree):
+        populate_gui_item(list_view, child)
+    elif tree.leaves:
+        # show an expander, the children are built by TreeView.expand_item
+        child.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
+
+
+def populate_gui_item(list_view: "TreeView", item: QTreeWidgetItem) -> None:
+    """Build the children of a GUI tree item from its dependency_tree.
+
+    Children that need opening are populated and expanded in turn. This
+    uses an explicit stack so deep trees don't hit the recursion limit.
+    Items are only expanded once the whole subtree is built, deepest first,
+    so no rows are inserted under an already expanded item.
+    """
+    stack = [item]
+    populated = []
+    while stack:
+        current = stack.pop()
+        current.populated = True
+        populated.append(current)
+        children = []
+        for leaf in current.tree.leaves:
+            child = new_gui_item(list_view, leaf)
+            if list_view.subtree_needs_open(leaf):
+                stack.append(child)
+            elif leaf.leaves:
+                child.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
+            children.append(child)
+        # attach all the children at once rather than one insert per item
+        current.addChildren(children)
+    for current in reversed(populated):
+        current.setExpanded(True)
 
 
 class TreeView(QTreeWidget):
@@ -117,15 +192,155 @@ class TreeView(QTreeWidget):
         palette.setColor(QPalette.Base, QColor(212, 216, 236))
         self.viewport().setPalette(palette)
         self.tree = tree
-        self.clashes = tree.clashes(print_warnings=False)
+        self.set_clashes()
+        # whether each module has leaves that need opening, keyed by id(tree)
+        self._open_cache = {}
+        # GUI item for each module, keyed by id(tree)
+        self.item_for = {}
         self.setRootIsDecorated(True)
+        # items are kept in RELEASE file order and all have the same height
+        self.setSortingEnabled(False)
+        self.setUniformRowHeights(True)
         # connect event handlers
         self.viewportEntered.connect(self.mouseout)
-        build_gui_tree(self, tree)
+        self.rebuild()
         self.child.setExpanded(True)
+        self._hover_item = None
+        self._hover_timer = QTimer(self)
+        self._hover_timer.setSingleShot(True)
+        self._hover_timer.setInterval(50)
+        self._hover_timer.timeout.connect(self.showHover)
         self.itemEntered.connect(self.mousein)
+        self.itemExpanded.connect(self.expand_item)
         self.setMouseTracking(True)
 
+    def set_clashes(self, names=None):
+        """Find the clashes in self.tree and the latest path for each name.
+
+        If names is given, only the clashes for those module names are found
+        again, the rest are kept from the last call.
+        """
+        clashes = self.tree.clashes(print_warnings=False, names=names)
+        if names is None:
+            self.clashes = {}
+            self.clash_winner = {}
+        else:
+            for name in names:
+                self.clashes.pop(name, None)
+                self.clash_winner.pop(name, None)
+        self.clashes.update(clashes)
+        # clashes() sorts each list by version, so the latest is last
+        for name, leaves in clashes.items():
+            self.clash_winner[name] = leaves[-1].path
+
+    def rebuild(self):
+        """Rebuild the GUI tree from self.tree.
+
+        Redraws, signals and mouse tracking are suppressed until the whole tree
+        is built.
+        """
+        self.setUpdatesEnabled(False)
+        self.blockSignals(True)
+        tracking = self.hasMouseTracking()
+        self.setMouseTracking(False)
+        try:
+            build_gui_tree(self, self.tree)
+        finally:
+            self.setMouseTracking(tracking)
+            self.blockSignals(False)
+            self.setUpdatesEnabled(True)
+        self.viewport().update()
+
+    def subtree_needs_open(self, tree):
+        """Return True if any module below tree needs its parents opened.
+
+        The subtree is walked in post-order with an explicit stack, so deep
+        trees don't hit the recursion limit.
+        """
+        cache = self._open_cache
+        stack = [(tree, False)]
+        while stack:
+            node, visited = stack.pop()
+            if id(node) in cache:
+                continue
+            if visited:
+                # every leaf below node has been worked out by now
+                cache[id(node)] = any(
+                    gui_item_state(self, leaf)[2] or cache[id(leaf)]
+                    for leaf in node.leaves
+                )
+            else:
+                stack.append((node, True))
+                stack.extend((leaf, False) for leaf in node.leaves)
+        return cache[id(tree)]
+
+    def expand_item(self, item):
+        """Build the children of item the first time it is expanded."""
+        if not item.populated:
+            self.setUpdatesEnabled(False)
+            try:
+                populate_gui_item(self, item)
+            finally:
+                self.setUpdatesEnabled(True)
+
+    def replace_item(self, leaf, new_leaf, names):
+        """Replace the GUI subtree of leaf with one built from new_leaf.
+
+        Only items for modules in names are recoloured. These should be the
+        names in the old and new subtrees, as those are the only ones whose
+        clashes can change. The parents of any of them that now need showing
+        are opened.
+        """
+        old_item = self.item_for[id(leaf)]
+        # forget every item in the old GUI subtree, including duplicates of
+        # a module, so none of them is recoloured once it has been deleted
+        stack = [old_item]
+        while stack:
+            item = stack.pop()
+            self.item_for.pop(id(item.tree), None)
+            stack.extend(item.child(i) for i in range(item.childCount()))
+        parent_item = old_item.parent()
+        index = parent_item.indexOfChild(old_item)
+        self._open_cache.clear()
+        self.setUpdatesEnabled(False)
+        self.blockSignals(True)
+        tracking = self.hasMouseTracking()
+        self.setMouseTracking(False)
+        try:
+            parent_item.takeChild(index)
+            build_gui_tree(self, new_leaf, parent_item, index)
+            for item in self.item_for.values():
+                if item.tree.name in names:
+                    color_gui_item(self, item)
+            self.open_parents(names)
+        finally:
+            self.setMouseTracking(tracking)
+            self.blockSignals(False)
+            self.setUpdatesEnabled(True)
+        self.viewport().update()
+
+    def open_parents(self, names):
+        """Open the parents of every module in names that now needs showing.
+
+        Parents that have not been built yet are populated from the top down.
+        """
+        stack = [self.tree]
+        while stack:
+            tree = stack.pop()
+            stack.extend(tree.leaves)
+            if tree.name not in names or not gui_item_state(self, tree)[2]:
+                continue
+            parents = []
+            parent = tree.parent
+            while parent is not None:
+                parents.append(parent)
+                parent = parent.parent
+            for parent in reversed(parents):
+                item = self.item_for[id(parent)]
+                if not item.populated:
+                    populate_gui_item(self, item)
+                item.setExpanded(True)
+
     def contextMenuEvent(self, event):
         """Popup a context menu at pos.
 
@@ -134,23 +349,24 @@ class TreeView(QTreeWidget):
         """
         pos = event.globalPos()
         item = self.itemAt(event.pos())
+        # don't update the statusBar behind the menu
+        self._hover_timer.stop()
         if item:
             menu = QMenu()
             self.contextItem = item
             menu.addAction("Edit RELEASE", self.externalEdit)
             if hasattr(item.tree, "versions"):
-                if item.tree.versions: # if list is not empty
+                if item.tree.versions:  # if list is not empty
                     if item.tree.version != item.tree.versions[0][0]:
                         menu.addAction("SVN log", self.svn_log)
-                self.context_methods = []
-                for version, path in [
-                    (v, p) for v, p in item.tree.versions if v != item.tree.version
-                ]:
-                    self.context_methods.append(reverter(item.tree, self, path))
-                    menu.addAction(
-                        "Change to %s" % version, self.context_methods[-1].revert
-                    )
-            menu.exec_(pos)
+                # the version actions carry their path rather than each
+                # having a connected reverter
+                for version, path in item.tree.versions:
+                    if version != item.tree.version:
+                        menu.addAction("Change to %s" % version).setData(path)
+            action = menu.exec_(pos)
+            if action is not None and action.data():
+                reverter(item.tree, self, action.data()).revert()
 
     def svn_log(self):
         """Find out the svn logs between the original and current release numbers.
@@ -158,32 +374,55 @@ class TreeView(QTreeWidget):
         Uses dls-logs-since-release.py.
         """
         leaf = self.contextItem.tree
-        args = ["dls-logs-since-release.py", "-r", leaf.name]
+        args = ["-r", leaf.name]
         if leaf.versions[0][0] != "work":
             args += [leaf.versions[0][0], leaf.version]
-        p = Popen(args, stdout=PIPE, stderr=PIPE)
-        (stdout, stderr) = p.communicate()
-        text = stdout.strip()
-        x = formLog(text, self)
+        x = formLog("", self)
         x.setWindowTitle("SVN Log: %s" % leaf.name)
+        # run the script without blocking the GUI, showing output as it arrives
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        proc = QProcess(x)
+        proc.setStandardErrorFile(QProcess.nullDevice())
+        proc.readyReadStandardOutput.connect(
+            lambda: x.appendText(decoder.decode(bytes(proc.readAllStandardOutput())))
+        )
+        proc.start("dls-logs-since-release.py", args)
         x.show()
 
     def externalEdit(self):
-        """Open the configure/RELEASE in gedit."""
+        """Open the configure/RELEASE in gedit.
+
+        The cached paths and subtrees are forgotten once gedit exits, so
+        later reverts see the edited file.
+        """
         item = self.contextItem
         if item and os.path.isfile(item.tree.release()):
             proc = QProcess(self)
+            proc.finished.connect(lambda *args: dependency_tree.clear_cache())
             proc.start("gedit", [item.tree.release()])
 
     def mouseout(self):
         """Show hints in the statusBar on mouseout."""
+        self._hover_timer.stop()
         self.top.statusBar.showMessage(
             "----- Hover over a module for its path, "
             "right click for a context menu -----"
         )
 
     def mousein(self, item, col):
-        """Show item path in the statusBar on mousein."""
+        """Show item path in the statusBar on mousein.
+
+        The message is shown once the mouse has settled, so moving across
+        many items only updates the statusBar once.
+        """
+        self._hover_item = item
+        self._hover_timer.start()
+
+    def showHover(self):
+        """Show the path of the last item the mouse entered in the statusBar."""
+        item = self._hover_item
+        if item is None:
+            return
         text = "%s - current: %s" % (item.tree.name, item.tree.path)
         updates = item.tree.updates()
         if len(updates) > 1:
@@ -212,7 +451,54 @@ class TreeView(QTreeWidget):
             QMessageBox.No,
         )
         if response == QMessageBox.Yes:
-            build_ioc(release_path)
+            self.build_ioc(release_path)
+
+    def build_ioc(self, release_path):
+        """Remake the IOC without blocking the GUI.
+
+        Each make step is run in turn with its output shown as it arrives,
+        stopping at the first one that fails.
+        """
+        build = prepare_build(release_path)
+        if build is None:
+            return
+        builder_path, make_commands = build
+        x = formLog("", self)
+        x.setWindowTitle("Build IOC: %s" % os.path.basename(release_path))
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        proc = QProcess(x)
+        proc.setProcessChannelMode(QProcess.MergedChannels)
+        proc.setWorkingDirectory(builder_path)
+        proc.readyReadStandardOutput.connect(
+            lambda: x.appendText(decoder.decode(bytes(proc.readAllStandardOutput())))
+        )
+        commands = iter(make_commands)
+
+        def failed():
+            x.appendText(
+                "\nFailed to build IOC: %s\n"
+                % " ".join([proc.program()] + proc.arguments())
+            )
+
+        def run_next(exit_code=0, exit_status=QProcess.NormalExit):
+            if exit_code != 0 or exit_status != QProcess.NormalExit:
+                failed()
+                return
+            command = next(commands, None)
+            if command is None:
+                x.appendText("\nIOC built\n")
+            else:
+                proc.start(command[0], command[1:])
+
+        def error(process_error):
+            # a process that fails to start never emits finished
+            if process_error == QProcess.FailedToStart:
+                failed()
+
+        proc.finished.connect(run_next)
+        proc.errorOccurred.connect(error)
+        x.show()
+        run_next()
 
     def printChanges(self):
         """Print changes to dependencies."""
@@ -241,8 +527,15 @@ class reverter:
         new_leaf = dependency_tree(self.leaf.parent, self.path)
         new_leaf.versions = self.leaf.versions
         self.list_view.tree.replace_leaf(self.leaf, new_leaf)
-        self.list_view.clashes = self.list_view.tree.clashes(print_warnings=False)
-        build_gui_tree(self.list_view, self.list_view.tree)
+        if not any(x is new_leaf for x in self.leaf.parent.leaves):
+            # replace_leaf refused to make the change
+            return
+        # only modules named in the old or new subtree can change clashes
+        names = {
+            x.name for x in self.leaf.flatten(remove_dups=False) + new_leaf.flatten()
+        }
+        self.list_view.set_clashes(names)
+        self.list_view.replace_item(self.leaf, new_leaf, names)
 
 
 class formLog(QDialog):
@@ -269,6 +562,56 @@ class formLog(QDialog):
         self.btnClose.clicked.connect(self.close)
         self.btnClose.setText("Close")
 
+    def appendText(self, text):
+        """Append text to the end of the log without adding a newline."""
+        self.lab.moveCursor(QTextCursor.End)
+        self.lab.insertPlainText(text)
+
+
+class update_thread(QThread):
+    """Thread that makes the dependency_tree_update for each tree view."""
+
+    locs = ["original", "latest", "consistent"]
+    # emitted with (loc, dependency_tree_update or None, error traceback)
+    updateReady = pyqtSignal(str, object, str)
+
+    def __init__(self, tree, *args):
+        """Update thread constructor.
+
+        tree = original dependency_tree to make the updates from
+        """
+        QThread.__init__(self, *args)
+        self.tree = tree
+
+    def run(self):
+        """Make the update for each loc in turn, emitting each one."""
+        latest = None
+        for loc in self.locs:
+            try:
+                # the consistent tree starts from the latest one rather than
+                # searching for updates again
+                update = dependency_tree_update(
+                    self.tree,
+                    consistent=(loc == "consistent"),
+                    update=(loc != "original"),
+                    latest=latest,
+                )
+            except Exception:
+                self.updateReady.emit(loc, None, traceback.format_exc())
+                continue
+            if loc == "latest":
+                # the GUI can change the trees it is given, so keep this one
+                # for the consistent update and emit a copy of it
+                latest = update
+                update = dependency_tree_update(
+                    self.tree, consistent=False, latest=latest
+                )
+            elif update.new_tree is self.tree:
+                # with no updates the new tree is the original, which this
+                # thread still reads, so the GUI gets a copy of it
+                update.new_tree = self.tree.copy()
+            self.updateReady.emit(loc, update, "")
+
 
 def dependency_checker() -> None:
     """Parse arguments, intialise treeviews and display them."""
@@ -282,7 +625,7 @@ def dependency_checker() -> None:
     )
     parser.add_argument(
         "--strict",
-        action='store_true',
+        action="store_true",
         help="Enforce strict version numbering",
     )
     args = parser.parse_args()
@@ -298,47 +641,78 @@ def dependency_checker() -> None:
         % (tree.name, tree.version, tree.e.epicsVer())
     )
 
-    getattr(top, "buildIoc").clicked.connect(lambda: view.confirmBuildIoc(path))
+    views = []
 
-    for loc in ["original", "latest", "consistent"]:
+    def buildIoc():
+        if views:
+            views[-1].confirmBuildIoc(path)
 
-        def displayMessage(message):
-            getattr(top, loc + "Write").setEnabled(False)
-            getattr(top, loc + "Print").setEnabled(False)
-            label = QTextEdit(getattr(top, loc + "Frame"))
-            label.setReadOnly(True)
-            label.setText(loc.title() + " Updated Tree:\n\n" + message)
-            return label
+    getattr(top, "buildIoc").clicked.connect(buildIoc)
 
-        grid = QGridLayout()
+    # look up the frame and buttons of each pane once
+    panes = {
+        loc: (
+            getattr(top, loc + "Frame"),
+            getattr(top, loc + "Write"),
+            getattr(top, loc + "Print"),
+        )
+        for loc in update_thread.locs
+    }
+
+    def setPane(loc, widget):
+        # replace whatever is currently shown in the pane for loc
+        grid = panes[loc][0].layout()
+        old = grid.itemAt(0).widget() if grid.count() else None
+        if old is not None:
+            grid.removeWidget(old)
+            old.deleteLater()
+        grid.addWidget(widget)
+
+    def displayMessage(loc, message):
+        frame, write_button, print_button = panes[loc]
+        write_button.setEnabled(False)
+        print_button.setEnabled(False)
+        label = QTextEdit(frame)
+        label.setReadOnly(True)
+        label.setText(loc.title() + " Updated Tree:\n\n" + message)
+        setPane(loc, label)
+
+    def showUpdate(loc, update, error):
+        if update is None:
+            displayMessage(loc, "Error in tree update...\n\n" + error)
+            return
+        if loc != "original" and update.new_tree == tree:
+            displayMessage(loc, "Updated tree is identical to Original tree")
+            return
+        frame, write_button, print_button = panes[loc]
         try:
-            update = dependency_tree_update(
-                tree, consistent=(loc == "consistent"), update=(loc != "original")
-            )
-            if loc == "original" or not update.new_tree == tree:
-                view = TreeView(update.new_tree, loc, getattr(top, loc + "Frame"))
-
-                setattr(view, "top", top)
-                setattr(view, "update", update)
-
-                getattr(top, loc + "Write").clicked.connect(view.confirmWrite)
-                getattr(top, loc + "Print").clicked.connect(view.printChanges)
-                grid.addWidget(view)
-            else:
-                grid.addWidget(
-                    displayMessage("Updated tree is identical to Original tree")
-                )
-
+            view = TreeView(update.new_tree, loc, frame)
         except Exception:
-            grid.addWidget(
-                displayMessage("Error in tree update...\n\n" + traceback.format_exc())
-            )
-        getattr(top, loc + "Frame").setLayout(grid)
-
+            displayMessage(loc, "Error in tree update...\n\n" + traceback.format_exc())
+            return
+        setattr(view, "top", top)
+        setattr(view, "update", update)
+        write_button.clicked.connect(view.confirmWrite)
+        print_button.clicked.connect(view.printChanges)
+        write_button.setEnabled(True)
+        print_button.setEnabled(True)
+        views.append(view)
+        setPane(loc, view)
+
+    for loc, (frame, _, _) in panes.items():
+        frame.setLayout(QGridLayout())
+        displayMessage(loc, "Updating...")
+
+    # work out the updated trees in the background so the window appears
+    # straight away, and fill in each pane as its tree is ready
+    thread = update_thread(tree)
+    thread.updateReady.connect(showUpdate, Qt.QueuedConnection)
     window.show()
+    thread.start()
     # catch CTRL-C
     signal.signal(signal.SIGINT, signal.SIG_DFL)
     app.exec_()
+    thread.wait()
 
 
 if __name__ == "__main__":
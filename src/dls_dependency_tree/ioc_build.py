@@ -1,27 +1,65 @@
 import os
 import re
 import shutil
+import subprocess
+from pathlib import Path
+from typing import List, Optional, Tuple
 
+BUILDER_IOC_REGEX = re.compile(
+    r"^\/dls_sw\/work\/R3\.14\.12\.7\/support\/BL[0-9]{2}[BIJK]-BUILDER"
+    r"\/etc\/makeIocs\/BL[0-9]{2}[BIJK]-[A-Z0-9]{2}-IOC-[0-9]{2}_RELEASE$"
+)
+# literal start of every path BUILDER_IOC_REGEX matches
+_BUILDER_PREFIX = "/dls_sw/work/R3.14.12.7/support/BL"
 
-def build_ioc(release_path: str):
-    if not re.match(r"^\/dls_sw\/work\/R3\.14\.12\.7\/support\/BL[0-9]{2}[BIJK]-BUILDER"
-                    r"\/etc\/makeIocs\/BL[0-9]{2}[BIJK]-[A-Z0-9]{2}-IOC-[0-9]{2}_RELEASE$",
-                    release_path):
+
+def prepare_build(release_path: str) -> Optional[Tuple[str, List[List[str]]]]:
+    """Get ready to rebuild the IOC for a builder RELEASE path.
+
+    Removes the old IOC and touches its xml file, then returns the builder
+    path and the make commands to run there in order, or None on failure.
+    """
+    if not (
+        release_path.startswith(_BUILDER_PREFIX)
+        and BUILDER_IOC_REGEX.match(release_path)
+    ):
         print("Could not build IOC as not a valid builder RELEASE path")
-        return
+        return None
     parts = release_path.split("/")
     builder_path = "/".join(parts[:6])
-    ioc_name = parts[-1].rstrip("_RELEASE")
+    ioc_name = parts[-1].removesuffix("_RELEASE")
+    ioc_dir = os.path.join(builder_path, "iocs", ioc_name)
     print(builder_path, ioc_name)
 
-    if os.path.isdir(f"{builder_path}/iocs/{ioc_name}"):
-        shutil.rmtree(f"{builder_path}/iocs/{ioc_name}", ignore_errors=True)
+    if os.path.isdir(ioc_dir):
+        shutil.rmtree(ioc_dir, ignore_errors=True)
+
+    try:
+        Path(f"{builder_path}/etc/makeIocs/{ioc_name}.xml").touch()
+    except OSError as e:
+        print("Failed to build IOC:", e)
+        return None
+    return builder_path, [
+        ["make", "-C", "etc/makeIocs", f"IOCS={ioc_name}"],
+        ["make", "-C", f"iocs/{ioc_name}"],
+    ]
 
-    make_command = f"""
-        cd {builder_path} && \
-        touch etc/makeIocs/{ioc_name}.xml && \
-        make -C etc/makeIocs IOCS={ioc_name} && \
-        make -C iocs/{ioc_name};
-    """
-    os.system(make_command)
 
+def build_ioc(release_path: str):
+    """Rebuild the IOC for a builder RELEASE path, blocking until done."""
+    build = prepare_build(release_path)
+    if build is None:
+        return
+    builder_path, make_commands = build
+    # run each step directly rather than through a shell, stopping at the
+    # first one that fails
+    for make_command in make_commands:
+        try:
+            failed = subprocess.run(make_command, cwd=builder_path).returncode != 0
+        except OSError as e:
+            # a command that can't be run, like a missing make, fails the step
+            print(e)
+            failed = True
+        if failed:
+            print("Failed to build IOC:", " ".join(make_command))
+            return
@@ -1,11 +1,28 @@
 #!/bin/env dls-python
 """Script to create the dependency tree."""
+
+import functools
 import glob
+import itertools
 import os
 import re
+import stat
 import sys
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from optparse import OptionParser
-from typing import Dict, List, Optional, Tuple, Union
+from typing import (
+    Callable,
+    DefaultDict,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 import dls_ade.dls_environment
 
@@ -20,6 +37,149 @@ and it has a directory PATH/data, then PATH/data will appear in the output list
 of paths. If <glob>="*App/opi/edl" and PATH/moduleApp/opi/edl exists then it
 will appear in the output list of paths"""
 
+# macro references of the form $(MACRO), ${MACRO} or $MACRO
+_MACRO_RE = re.compile(r"\$\(([^\)]+)\)|\$\{([^\}]+)\}|\$([a-zA-Z_][a-zA-Z0-9_]*)")
+# a line defining a macro, giving its name and value with whitespace stripped.
+# The value stops at any second "="
+_DEFINE_RE = re.compile(r"\s*([^=]*?)\s*=\s*([^=]*?)\s*(?:=|$)")
+# an include or -include line, giving the file name
+_INCLUDE_RE = re.compile(r"\s*-?include\s+(\S+)")
+# version directory names allowed in strict mode, like 4-3 or 6-3dls1
+_STRICT_VERSION_RE = re.compile(r"^[0-9\-]*(dls)*[0-9\-]*$")
+# values of macros that are flags rather than modules
+_FLAGS = frozenset(["YES", "NO", "TRUE", "FALSE"])
+_FLAG_LEN = max(len(x) for x in _FLAGS)
+
+# threads for parallel_map
+_executor = ThreadPoolExecutor(max_workers=16)
+
+# (name, version) of each module path, keyed by (epics version, path)
+_classify_cache: Dict[Tuple[str, str], Tuple[str, str]] = {}
+
+# dev and prod area paths, keyed by (epics version, prod, area)
+_area_cache: Dict[Tuple[str, bool, str], str] = {}
+
+# updates() of each module, keyed by (path, name, strict, epics version), with
+# the stamp of the directory its releases were listed from. The same modules
+# are looked up by every update of a tree and by the GUI
+_updates_cache: Dict[
+    Tuple[str, str, bool, str], Tuple[Optional[Tuple[int, int]], List[str]]
+] = {}
+
+# detached copies of the subtrees already made for each module path, keyed by
+# everything else the subtree depends on, with the (path, stamp) of every file
+# read to make them. The same low level modules are reached through many
+# parents, and again whenever a leaf is replaced
+_subtree_cache: Dict[
+    Tuple, Tuple[Set[Tuple[str, Optional[Tuple[int, int]]]], "dependency_tree"]
+] = {}
+
+
+_T = TypeVar("_T")
+_R = TypeVar("_R")
+
+
+def parallel_map(func: Callable[[_T], _R], items: Iterable[_T]) -> List[_R]:
+    """Return [func(x) for x in items], with the calls made in parallel.
+
+    This is for work that spends most of its time waiting on the filesystem,
+    like making subtrees or searching for updates.
+    """
+    return list(_executor.map(func, items))
+
+
+def _area(e: dls_ade.dls_environment.environment, area: str, prod: bool) -> str:
+    """Return e.prodArea(area) if prod, or e.devArea(area) if not.
+
+    These only depend on the epics version, and are needed for every module
+    in a tree.
+    """
+    key = (e.epicsVer(), prod, area)
+    path = _area_cache.get(key)
+    if path is None:
+        path = _area_cache[key] = e.prodArea(area) if prod else e.devArea(area)
+    return path
+
+
+def _file_stamp(path: str) -> Optional[Tuple[int, int]]:
+    """Return the (mtime, size) of the file at path, or None if it is missing.
+
+    This is never cached, so it changes as soon as the file is edited, or for a
+    directory as soon as an entry is added or removed.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _read_lines(
+    path: str, stamps: Dict[str, Optional[Tuple[int, int]]]
+) -> Tuple[str, ...]:
+    """Return the lines of the file at path, or () if it cannot be read.
+
+    RELEASE files are shared by many modules in a tree, so each version of
+    a file is only read once. Versions are told apart by their mtime and
+    size, so a file edited on disk is read again. The stamp of the version
+    read is stored in stamps.
+    """
+    stamp = stamps[path] = _file_stamp(path)
+    return _read_stamped(path, stamp)
+
+
+@functools.lru_cache(maxsize=4096)
+def _read_stamped(path: str, stamp: Optional[Tuple[int, int]]) -> Tuple[str, ...]:
+    """Return the lines of the file at path when it had the given stamp."""
+    try:
+        with open(path) as f:
+            return tuple(f.readlines())
+    except IOError:
+        return ()
+
+
+@functools.lru_cache(maxsize=16384)
+def _stat(path: str) -> Optional[os.stat_result]:
+    """Return os.stat(path), or None if path does not exist.
+
+    The same module directories and RELEASE files are probed many times
+    while building a tree, and on NFS each probe is a round trip.
+    """
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def _isfile(path: str) -> bool:
+    """Return whether path is a file, using the cached stat."""
+    st = _stat(path)
+    return st is not None and stat.S_ISREG(st.st_mode)
+
+
+def _isdir(path: str) -> bool:
+    """Return whether path is a directory, using the cached stat."""
+    st = _stat(path)
+    return st is not None and stat.S_ISDIR(st.st_mode)
+
+
+def _listdir(path: str) -> Tuple[str, ...]:
+    """Return the names in directory path, or () if it cannot be listed.
+
+    Each directory is only listed again once it changes.
+    """
+    return _listdir_stamped(path, _file_stamp(path))
+
+
+@functools.lru_cache(maxsize=4096)
+def _listdir_stamped(path: str, stamp: Optional[Tuple[int, int]]) -> Tuple[str, ...]:
+    """Return the names in directory path as it was when it had stamp."""
+    try:
+        with os.scandir(path) as entries:
+            return tuple(entry.name for entry in entries)
+    except OSError:
+        return ()
+
 
 class dependency_tree:
     """A class for parsing configure/RELEASE for module names and versions."""
@@ -33,7 +193,7 @@ class dependency_tree:
         includes: bool = True,
         warnings: bool = True,
         hostarch: Optional[str] = None,
-        strict: bool = False
+        strict: bool = False,
     ):
         """Initialise the object.
 
@@ -51,6 +211,7 @@ class dependency_tree:
         self.parent = parent
         self.includes = includes
         self.warnings = warnings
+        # path to the RELEASE file, once known
         self._release: Optional[str] = None
         self.strict = strict
         # this is the epics host arch
@@ -58,12 +219,16 @@ class dependency_tree:
             self.hostarch = hostarch
         else:
             self.hostarch = os.environ.get("EPICS_HOST_ARCH", "linux-x86_64")
-        # dls.environment object for getting paths and release order
+        # dls.environment object for getting paths and release order. This is
+        # shared with the parent until this module needs to change it
+        self.e: dls_ade.dls_environment.environment
         if self.parent:
             self.strict = self.parent.strict
-            self.e: dls_ade.dls_environment.environment = self.parent.e.copy()
+            self.e = self.parent.e
+            self._e_owned = False
         else:
             self.e = dls_ade.dls_environment.environment()
+            self._e_owned = True
         # list of child dependency_tree leaves of this modules
         self.leaves: List[dependency_tree] = []
         # path to module root (like /dls_sw/work/R3.14.8.2/support/motor)
@@ -76,35 +241,89 @@ class dependency_tree:
         # dict of fully substituted macros
         # (like macros["SUPPORT"]="/dls_sw/prod/R3.14.8.2/support")
         self.macros: Dict[str, str] = {"TOP": "."}
+        # macros with each non empty value, built from self.macros when first
+        # needed by replace_macros
+        self._rev_macros: Optional[Dict[str, List[str]]] = None
         self.macro_order: List[str] = []
+        # index of the last line in self.lines defining each macro, built
+        # when first needed by replace_leaf
+        self._define_index: Optional[Dict[str, int]] = None
+        # the ids of the last clashing leaves for each module name, and those
+        # leaves sorted by version
+        self._clash_order: Dict[str, Tuple[Tuple[int, ...], List[dependency_tree]]] = {}
         # stored lines of the RELEASE file. Updated as changes are written
         self.lines: List[str] = []
         self.extra_lines: List[str] = []
+        # (mtime, size) of each file read to make this module
+        self.file_stamps: Dict[str, Optional[Tuple[int, int]]] = {}
         if self.module_path:
             # import a configure RELEASE
             self.process_module(self.module_path)
 
+    @classmethod
+    def clear_cache(cls) -> None:
+        """Forget files read and paths probed while building trees.
+
+        Long running processes should call this if the filesystem changes.
+        """
+        _read_stamped.cache_clear()
+        _stat.cache_clear()
+        _listdir_stamped.cache_clear()
+        _classify_cache.clear()
+        _area_cache.clear()
+        _updates_cache.clear()
+        _subtree_cache.clear()
+
     def copy(self) -> "dependency_tree":
-        """Return a copy of this dependency_tree object."""
+        """Return a copy of this dependency_tree object.
+
+        Only modules that own their environment get a copy of it, the rest
+        share their new parent's as the originals did.
+        """
+        # make it as a child of self so it borrows this environment instead of
+        # constructing a default one, which is replaced by a copy straight after
+        new_tree = self.copy_module(self, own_e=True)
+        new_tree.parent = self.parent
+        # copy the leaves with an explicit stack so deep trees don't hit the
+        # recursion limit
+        stack = [(self, new_tree)]
+        while stack:
+            tree, new_parent = stack.pop()
+            for leaf in tree.leaves:
+                new_leaf = leaf.copy_module(new_parent)
+                new_parent.leaves.append(new_leaf)
+                stack.append((leaf, new_leaf))
+        return new_tree
+
+    def copy_module(
+        self, parent: "dependency_tree", own_e: bool = False
+    ) -> "dependency_tree":
+        """Return a copy of this module without its leaves, as a child of parent.
+
+        The copy gets a copy of the environment if own_e is True or this
+        module owns its environment, otherwise it shares parent's.
+        """
         new_tree: dependency_tree = dependency_tree(
-            self.parent,
+            parent,
             includes=self.includes,
             warnings=self.warnings,
             hostarch=self.hostarch,
-            strict=self.strict
+            strict=self.strict,
         )
-        new_tree.e = self.e.copy()
+        new_tree.strict = self.strict
         new_tree.path = self.path
+        new_tree._release = self._release
         new_tree.name = self.name
         new_tree.version = self.version
+        new_tree.versions = self.versions[:]
         new_tree.macros = self.macros.copy()
         new_tree.macro_order = self.macro_order[:]
         new_tree.lines = self.lines[:]
         new_tree.extra_lines = self.extra_lines[:]
-        for leaf in self.leaves:
-            new_leaf = leaf.copy()
-            new_leaf.parent = new_tree
-            new_tree.leaves.append(new_leaf)
+        new_tree.file_stamps = self.file_stamps.copy()
+        if own_e or self._e_owned:
+            new_tree.e = self.e.copy()
+            new_tree._e_owned = True
         return new_tree
 
     def __repr__(self) -> str:
@@ -116,96 +335,136 @@ class dependency_tree:
         if not isinstance(tree, dependency_tree):
             return NotImplemented
 
-        output = (
-            self.name == tree.name
-            and self.version == tree.version
-            and len(self.leaves) == len(tree.leaves)
-        )
-        if not output:
-            return output
-        for i in range(len(self.leaves)):
-            output = output and self.leaves[i] == tree.leaves[i]
-        return output
+        # compare the modules pairwise with an explicit stack rather than
+        # recursing, stopping at the first difference
+        stack = [(self, tree)]
+        while stack:
+            a, b = stack.pop()
+            if a is b:
+                continue
+            if (
+                a.name != b.name
+                or a.version != b.version
+                or len(a.leaves) != len(b.leaves)
+            ):
+                return False
+            stack += zip(a.leaves, b.leaves, strict=True)
+        return True
 
     def init_version(self) -> None:
         """Initialise self.name and self.version.
 
         This is done from self.path using the site environment settings.
         """
-        self.name, self.version = self.e.classifyPath(self.path)
-        # print self.path, self.e.classifyPath(self.path)
+        key = (self.e.epicsVer(), self.path)
+        classified = _classify_cache.get(key)
+        if classified is None:
+            classified = _classify_cache[key] = self.e.classifyPath(self.path)
+        self.name, self.version = classified
+
+    def __set_epics(self, epics: str) -> None:
+        """Set the epics version, copying the environment if it is shared."""
+        if self.e.epicsVer() == epics:
+            return
+        if not self._e_owned:
+            self.e = self.e.copy()
+            self._e_owned = True
+        self.e.setEpics(epics)
+
+    def __releases_dir(self) -> str:
+        """Return the directory that holds every release of self."""
+        if "ioc" in self.path:
+            prefix = _area(self.e, "ioc", prod=True)
+        else:
+            prefix = _area(self.e, "support", prod=True)
+        return os.path.join(prefix, self.name)
 
-    def __possible_paths(self) -> List[str]:
-        """Return a list of all possible module paths for self.
+    def __possible_paths(self, prefix: str) -> List[str]:
+        """Return a list of all possible module paths for self under prefix.
 
         These are listed in ascending order.
         """
         # if self.name is None:
         #    return [self.path]
-        if "ioc" in self.path:
-            prefix = self.e.prodArea("ioc")
-        else:
-            prefix = self.e.prodArea("support")
-        prefix = os.path.join(prefix, self.name)
         paths = []
-        if os.path.isdir(prefix):
-            for version in os.listdir(prefix):
-                if ".tar.gz" in version:
-                    continue
-                if not self.strict or re.match(
-                    r"^[0-9\-]*(dls)*[0-9\-]*$", version
-                ):
-                    paths.append(os.path.join(prefix, version))
+        # a missing prefix lists as empty, so there is no need to check for it
+        for version in _listdir(prefix):
+            if version.endswith(".tar.gz"):
+                continue
+            if not self.strict or _STRICT_VERSION_RE.match(version):
+                paths.append(os.path.join(prefix, version))
         if self.path not in paths:
             paths = [self.path] + paths
         # return paths listed in ascending order
         return self.e.sortReleases(paths)
 
-    def __substitute_macros(self, dict: Dict[str, str]) -> Dict[str, str]:
-        """Substitute macros in dict."""
+    def __substitute_macros(self, macros: Dict[str, str]) -> Dict[str, str]:
+        """Substitute macro references in the values of the macros dict.
+
+        Macros are substituted after the macros they refer to, so each only
+        needs substituting once. Any left in a reference cycle fall back to
+        a few rounds of repeated substitution.
+        """
+
+        def substitution(match: re.Match[str]) -> str:
+            # unknown macros are substituted with an empty string
+            find = match.group(1) or match.group(2) or match.group(3)
+            return self.macros.get(find, "")
+
+        # the other keys of macros that each value still refers to, and the reverse
+        depends: Dict[str, Set[str]] = {}
+        dependents: DefaultDict[str, List[str]] = defaultdict(list)
+        for macro, value in macros.items():
+            if "$" not in value:
+                # most values are plain paths, with nothing to substitute
+                depends[macro] = set()
+                continue
+            depends[macro] = {
+                x.group(1) or x.group(2) or x.group(3)
+                for x in _MACRO_RE.finditer(value)
+            } & macros.keys()
+            for find in depends[macro]:
+                dependents[find].append(macro)
+        ready = deque(macro for macro, finds in depends.items() if not finds)
+        while ready:
+            macro = ready.popleft()
+            if "$" in macros[macro]:
+                macros[macro] = _MACRO_RE.sub(substitution, macros[macro])
+            del depends[macro]
+            for dependent in dependents[macro]:
+                depends[dependent].discard(macro)
+                if not depends[dependent]:
+                    ready.append(dependent)
+
         retries: int = 5
-        while retries > 0:
-            bracket_re = re.compile(r"\$\(([^\)]+)\)")
-            brace_re = re.compile(r"\$\{([^\)]+)\}")
-            open_re = re.compile(r"\$([a-zA-Z_][a-zA-Z0-9_]*)")
-            for macro in dict:
-                # print "m", macro
-                for find in (
-                    bracket_re.findall(dict[macro])
-                    + brace_re.findall(dict[macro])
-                    + open_re.findall(dict[macro])
-                ):
-                    # find all unsubstituted macros, and replace them with their
-                    # substitutions
-                    if find in list(self.macros.keys()):
-                        dict[macro] = dict[macro].replace(
-                            "$(" + find + ")", self.macros[find]
-                        )
-                        dict[macro] = dict[macro].replace(
-                            "${" + find + "}", self.macros[find]
-                        )
-                        dict[macro] = dict[macro].replace("$" + find, self.macros[find])
-                    else:
-                        dict[macro] = dict[macro].replace("$(" + find + ")", "")
-                        dict[macro] = dict[macro].replace("${" + find + "}", "")
-                        dict[macro] = dict[macro].replace("$" + find, "")
+        while depends and retries > 0:
+            changed = False
+            for macro in depends:
+                value = _MACRO_RE.sub(substitution, macros[macro])
+                if value != macros[macro]:
+                    macros[macro] = value
+                    changed = True
+            if not changed:
+                break
             retries -= 1
-        return dict
+        return macros
 
     def __process_line(self, line: str):
         """Process a line of configure/RELEASE after comments have been stripped out."""
         # check the line defines a macro
-        if "=" in line:
-            list: List[str] = [x.strip() for x in line.split("=")]
+        define = _DEFINE_RE.match(line)
+        if define:
+            name, value = define.groups()
             # try and find epics base in the line
-            match_: Union[re.Match[str], None] = self.e.epics_ver_re.search(list[1])
-            if list[0] == "EPICS_BASE" and match_:
+            match_: Union[re.Match[str], None] = self.e.epics_ver_re.search(value)
+            if name == "EPICS_BASE" and match_:
                 # if epics version is defined, set it in the environment
-                self.e.setEpics(match_.group())
+                self.__set_epics(match_.group())
                 # print "Set epics", match_.group(), self.name
             # otherwise, define it in the module dictionary
-            self.macros[list[0]] = list[1]
-            self.macro_order.append(list[0])
+            self.macros[name] = value
+            self._rev_macros = None
+            self.macro_order.append(name)
 
     def process_module(self, module_path: str) -> None:
         """Process the configure/RELEASE file and populate the tree from it.
@@ -214,6 +473,7 @@ class dependency_tree:
         """
         # set the path
         self.path = os.path.abspath(module_path.rstrip("/\n\r"))
+        self._release = None
 
         # Tools and python modules might have their paths passed with a "prefix" suffix.
         if os.path.basename(self.path) == "prefix":
@@ -223,13 +483,13 @@ class dependency_tree:
         # if RELEASE does not exist, make this a dummy module
         if self.path.endswith("RELEASE"):
             self._release = self.path
-            self.path = "/".join(self.path.split("/")[:-2])
+            self.path = os.path.dirname(os.path.dirname(self.path))
 
         # then set the name and version of the tree
         self.init_version()
 
-        if not os.path.isfile(self.release()):
-            if os.path.isdir(self.path):
+        if not _isfile(self.release()):
+            if _isdir(self.path):
                 # this module has no release file
                 return
             else:
@@ -243,7 +503,8 @@ class dependency_tree:
                 return
 
         # read in RELEASE
-        self.lines = open(self.release()).readlines()
+        self.lines = list(_read_lines(self.release(), self.file_stamps))
+        self._define_index = None
 
         pre_lines: List[str] = []
         post_lines: List[str] = []
@@ -256,37 +517,34 @@ class dependency_tree:
             r = os.path.abspath(
                 os.path.join(self.release(), "..", "..", "..", "configure", "RELEASE")
             )
-            if os.path.isfile(r):
-                pre_lines += open(r).readlines()
+            if _isfile(r):
+                pre_lines += _read_lines(r, self.file_stamps)
 
         # Check for RELEASE.$(EPICS_HOST_ARCH).Common files
         r = "%s.%s" % (r, self.hostarch)
-        if os.path.isfile(r + ".Common"):
-            post_lines += open(r + ".Common").readlines()
-        elif os.path.isfile(r):
-            post_lines += open(r).readlines()
-
-        # store current working directory then go to module base
-        cwd: str = os.getcwd()
-        os.chdir(self.path)
+        if _isfile(r + ".Common"):
+            post_lines += _read_lines(r + ".Common", self.file_stamps)
+        elif _isfile(r):
+            post_lines += _read_lines(r, self.file_stamps)
 
         # for each line in the RELEASE file, populate the macros dictionary if
         # it defines a support module
-        for line in pre_lines + self.lines + post_lines:
+        for line in itertools.chain(pre_lines, self.lines, post_lines):
             # strip comments
-            line = line.split("#")[0]
-            # check if the line contains "include" but not "-include". This will
-            # be a reference to a RELEASE file elsewhere in the file system
-            if "include" in line[:8]:
+            line = line.partition("#")[0]
+            # check if the line is an "include" or "-include". This will be a
+            # reference to a RELEASE file elsewhere in the file system
+            include = _INCLUDE_RE.match(line)
+            if include:
                 if self.includes:
-                    fname: str = line.split(" ")[1].rstrip()
+                    fname: str = include.group(1)
                     for module in self.macros:
                         fname = fname.replace("$(" + module + ")", self.macros[module])
-                    try:
-                        for line in open(fname, "r").readlines():
-                            self.__process_line(line)
-                    except IOError:
-                        pass
+                    # relative includes are relative to the module root, and
+                    # unreadable includes give no lines and are ignored
+                    fname = os.path.normpath(os.path.join(self.path, fname))
+                    for line in _read_lines(fname, self.file_stamps):
+                        self.__process_line(line)
             else:
                 self.__process_line(line)
 
@@ -299,50 +557,84 @@ class dependency_tree:
 
         # now try and substitute macros
         self.macros = self.__substitute_macros(self.macros)
+        self._rev_macros = None
 
         # remove any modules we know to be wrong and make trees from the rest of
         # them
+        module_paths: List[str] = []
+        # ignore macros that refer to this module explicitly, empty macros, and
+        # macros defining the development and production areas
+        ignore_values = {
+            ".",
+            "",
+            _area(self.e, "support", prod=False),
+            _area(self.e, "ioc", prod=False),
+            _area(self.e, "support", prod=True),
+            _area(self.e, "ioc", prod=True),
+        }
         for module in self.macro_order:
-            if module == "TOP" or self.macros[module] == ".":
-                # ignore TOP and any module that refers to itself explicitly
-                pass
-            elif self.macros[module].upper() in ["YES", "NO", "TRUE", "FALSE"]:
-                # ignore flags
-                pass
-            elif "python" in self.macros[module]:
+            value = self.macros[module]
+            if (
+                module == "TOP"
+                or module in self.ignore_list
+                or value in ignore_values
+                # ignore flags, which are too short to be module paths
+                or (len(value) <= _FLAG_LEN and value.upper() in _FLAGS)
                 # ignore python as it has its own build system
-                pass
-            elif self.macros[module] in [
-                self.e.devArea("support"),
-                self.e.devArea("ioc"),
-            ]:
-                # ignore macros defining the development areas
-                pass
-            elif self.macros[module] in [
-                self.e.prodArea("support"),
-                self.e.prodArea("ioc"),
-            ]:
-                # ignore macros defining the production areas
-                pass
-            elif self.macros[module] == "":
-                # ignore empty macros
-                pass
-            elif module not in self.ignore_list:
-                # module is probably valid
-                # so make a tree from it and add it to leaves
-                new_leaf: dependency_tree = dependency_tree(
-                    parent=self,
-                    module_path=self.macros[module],
-                    includes=self.includes,
-                    warnings=self.warnings,
-                    hostarch=self.hostarch,
-                    strict=self.strict
-                )
-                if new_leaf.name:
-                    self.leaves.append(new_leaf)
-
-        # go back to initial place and return the values
-        os.chdir(cwd)
+                or "python" in value
+            ):
+                continue
+            # module is probably valid
+            # so make a tree from it and add it to leaves
+            # relative paths are relative to the module root
+            module_paths.append(os.path.join(self.path, value))
+
+        def make_leaf(module_path: str) -> "dependency_tree":
+            key = (
+                module_path,
+                self.includes,
+                self.warnings,
+                self.hostarch,
+                self.strict,
+                self.e.epicsVer(),
+                self.name,
+            )
+            stamps, cached = _subtree_cache.get(key, (set(), None))
+            # a subtree is made again if any file it was made from has changed
+            if cached is not None and all(
+                _file_stamp(path) == stamp for path, stamp in stamps
+            ):
+                leaf = cached.copy()
+                leaf.parent = self
+                return leaf
+            leaf = dependency_tree(
+                parent=self,
+                module_path=module_path,
+                includes=self.includes,
+                warnings=self.warnings,
+                hostarch=self.hostarch,
+                strict=self.strict,
+            )
+            # subtrees with missing modules are made again each time so their
+            # warnings are printed
+            if all(x.version != "invalid" for x in leaf.flatten(remove_dups=False)):
+                cached = leaf.copy()
+                cached.parent = None
+                stamps = {
+                    item
+                    for x in leaf.flatten(remove_dups=False)
+                    for item in x.file_stamps.items()
+                }
+                _subtree_cache[key] = (stamps, cached)
+            return leaf
+
+        if self.parent is None and len(module_paths) > 1:
+            # the subtrees of the top level module are made in parallel, as
+            # they spend most of their time waiting on the filesystem
+            new_leaves = parallel_map(make_leaf, module_paths)
+        else:
+            new_leaves = [make_leaf(x) for x in module_paths]
+        self.leaves += [x for x in new_leaves if x.name]
 
     def flatten(
         self, include_self: bool = True, remove_dups: bool = True
@@ -354,15 +646,25 @@ class dependency_tree:
         Finally return this list.
         """
         output: List[dependency_tree] = []
-        for leaf in self.leaves:
-            flattened_list: List[dependency_tree] = leaf.flatten()
-            for leaf in flattened_list:
-                in_list: bool = False
-                for path in [x.path for x in output]:
-                    if leaf.path == path:
-                        in_list = True
-                if not remove_dups or not in_list:
-                    output.append(leaf)
+        # each leaf's own subtree always has its duplicates removed, so without
+        # remove_dups the leaves are flattened separately
+        for top in [self] if remove_dups else self.leaves:
+            # paths already in output
+            seen: Set[str] = set()
+            # walk the subtree in post-order with an explicit stack, so deep
+            # trees don't hit the recursion limit
+            stack = [(leaf, False) for leaf in reversed(top.leaves)]
+            while stack:
+                leaf, visited = stack.pop()
+                if visited:
+                    if leaf.path not in seen:
+                        seen.add(leaf.path)
+                        output.append(leaf)
+                else:
+                    stack.append((leaf, True))
+                    stack += [(x, False) for x in reversed(leaf.leaves)]
+            if top is not self:
+                output.append(top)
         if include_self:
             output.append(self)
         return output
@@ -382,7 +684,14 @@ class dependency_tree:
         leaves = self.flatten()
         for leaf in leaves:
             for g in globs:
-                gg = glob.glob(leaf.path + g)
+                pattern = leaf.path + g
+                if glob.has_magic(pattern):
+                    gg = glob.glob(pattern)
+                elif _stat(pattern) is not None:
+                    # plain paths only need an existence check
+                    gg = [pattern]
+                else:
+                    gg = []
                 poutput.extend(gg)
                 noutput.extend([leaf.name] * len(gg))
         if include_name:
@@ -391,71 +700,85 @@ class dependency_tree:
             return poutput
 
     def clashes(
-        self, print_warnings: bool = True
+        self, print_warnings: bool = True, names: Optional[Set[str]] = None
     ) -> Dict[str, List["dependency_tree"]]:
         """Return a dict of all clashes occurring in the tree.
 
         This dict has the format clashes[name] = [leaves]. The leaves associated with
         each name have leaf.name == name, and all have different leaf.version numbers.
-        If print_warnings, then warn if clashes exist.
+        If print_warnings, then warn if clashes exist. If names is given, only
+        modules with those names are checked.
         """
         leaves: List[dependency_tree] = self.flatten(remove_dups=False)
-        # clashes[name] = [leaves]
-        clashes: Dict[str, List["dependency_tree"]] = {}
-        # sort the flattened leaves by module name
+        # group the flattened leaves by module name
+        by_name: DefaultDict[str, List[dependency_tree]] = defaultdict(list)
         for leaf in leaves:
-            if leaf.name in clashes:
-                clashes[leaf.name] += [leaf]
-            else:
-                clashes[leaf.name] = [leaf]
-        # discard modules that are not causing a problem
-        for key in list(clashes.keys()):
-            # check version is identical to first in the list
-            compare: List[bool] = [
-                clashes[key][0].version == x.version for x in clashes[key]
-            ]
-            if min(compare) == 1:
-                del clashes[key]
-            else:
+            if names is None or leaf.name in names:
+                by_name[leaf.name].append(leaf)
+        # clashes[name] = [leaves], discarding modules that are not causing a
+        # problem
+        clashes: Dict[str, List["dependency_tree"]] = {}
+        for name, group in by_name.items():
+            version = group[0].version
+            if all(x.version == version for x in group):
+                continue
+            if print_warnings:
+                print(
+                    "*** Warning: releases do not form a consistent set:",
+                    file=sys.stderr,
+                )
+            for leaf in group:
+                assert isinstance(leaf.parent, dependency_tree)
                 if print_warnings:
                     print(
-                        "*** Warning: releases do not form a consistent set:",
+                        leaf.parent.name
+                        + ": "
+                        + leaf.parent.version
+                        + " defines "
+                        + leaf.name
+                        + " as "
+                        + leaf.path,
                         file=sys.stderr,
                     )
-                for leaf in clashes[key]:
-                    assert isinstance(leaf.parent, dependency_tree)
-                    if print_warnings:
-                        print(
-                            leaf.parent.name
-                            + ": "
-                            + leaf.parent.version
-                            + " defines "
-                            + leaf.name
-                            + " as "
-                            + leaf.path,
-                            file=sys.stderr,
-                        )
-        # now sort clashes by version, lowest first
-        for name in list(clashes.keys()):
-            modules: List[tuple[str, dependency_tree]] = [
-                (m.path, m) for m in clashes[name]
-            ]
-            new_list: List[dependency_tree] = [
-                x[1] for x in self.e.sortReleases(modules)
-            ]
-            clashes[name] = new_list
+            # now sort clashes by version, lowest first. Repeated calls while
+            # making a consistent set mostly see the same groups, so the sort
+            # is only done again when a name's group changes. The cached lists
+            # keep their leaves alive, so their ids can't be reused by others
+            key = tuple(map(id, group))
+            cached_key, ordered = self._clash_order.get(name, ((), []))
+            if cached_key != key:
+                modules: List[Tuple[str, dependency_tree]] = [
+                    (m.path, m) for m in group
+                ]
+                ordered = [x[1] for x in self.e.sortReleases(modules)]
+                self._clash_order[name] = (key, ordered)
+            clashes[name] = ordered[:]
+        # forget the names checked here that no longer clash
+        for name in list(self._clash_order):
+            if name not in clashes and (names is None or name in names):
+                del self._clash_order[name]
         return clashes
 
     def updates(self) -> List[str]:
         """Return all possible paths for self that are considered updates."""
-        paths = self.__possible_paths()
-        return paths[paths.index(self.path) :]
+        key = (self.path, self.name, self.strict, self.e.epicsVer())
+        prefix = self.__releases_dir()
+        # a new release changes the stamp of the directory it is made in
+        stamp = _file_stamp(prefix)
+        cached_stamp, updates = _updates_cache.get(key, (None, None))
+        if updates is None or cached_stamp != stamp:
+            paths = self.__possible_paths(prefix)
+            updates = paths[paths.index(self.path) :]
+            _updates_cache[key] = (stamp, updates)
+        return updates[:]
 
     def print_tree(self, spaces: int = 0) -> None:
         """Print an ascii art text representation of self."""
-        print(" |" * spaces + "-%s: %s (%s)" % (self.name, self.version, self.path))
-        for leaf in self.leaves:
-            leaf.print_tree(spaces + 1)
+        stack = [(self, spaces)]
+        while stack:
+            tree, depth = stack.pop()
+            print(" |" * depth + "-%s: %s (%s)" % (tree.name, tree.version, tree.path))
+            stack += [(leaf, depth + 1) for leaf in reversed(tree.leaves)]
 
     def release(self) -> str:
         """Return the path to the RELEASE file."""
@@ -464,12 +787,14 @@ class dependency_tree:
             return self._release
         ver: Union[re.Match[str], None] = self.e.epics_ver_re.search(self.path)
         if ver and ver.group() < "R3.14":
-            self.e.setEpics(ver.group())
+            self.__set_epics(ver.group())
         # if this cannot be found, use the default value
         if self.e.epicsVer() < "R3.14":
             release: str = os.path.join(self.path, "config", "RELEASE")
         else:
             release = os.path.join(self.path, "configure", "RELEASE")
+        # remember it, so the path is only searched once
+        self._release = release
         return release
 
     def replace_leaf(
@@ -482,30 +807,30 @@ class dependency_tree:
         leaf_path: str = leaf.path
         new_leaf_path: str = new_leaf.path
         # find the macro so that its substitution = leaf.path
-        for macro in list(self.macros.keys()):
+        for macro in self.macros:
             if self.macros[macro] == leaf_path:
                 break
-        # find the line in RELEASE that refers to it
-        found: Optional[List[str]] = None
-        for lines in [self.extra_lines, self.lines]:
-            for i, line in reversed(list(enumerate(lines))):
-                line = line.split("#")[0]
-                if "=" in line:
-                    macro_line = [x.strip() for x in line.split("=")]
-                    if macro == macro_line[0]:
-                        found = lines
-                        break
-        if found != self.lines:
+        # find the last line in RELEASE that defines it
+        if self._define_index is None:
+            self._define_index = {}
+            for i, line in enumerate(self.lines):
+                define = _DEFINE_RE.match(line.partition("#")[0])
+                if define:
+                    self._define_index[define.group(1)] = i
+        i = self._define_index.get(macro, -1)
+        if i < 0:
             print(
                 "Cannot update %s as macro %s is not defined in it"
                 % (self.release(), macro)
             )
             return
+        line = self.lines[i].partition("#")[0]
+        define = _DEFINE_RE.match(line)
+        assert define is not None
         # replace macros in that line
-        dict: Dict[str, str] = {}
-        dict[macro_line[0]] = macro_line[1]
+        name, value = define.groups()
         new_line: str = line.replace(
-            macro_line[1], self.__substitute_macros(dict)[macro_line[0]]
+            value, self.__substitute_macros({name: value})[name]
         )
         # now replace the old leaf path for the new leaf path
         if leaf_path not in new_line:
@@ -518,19 +843,36 @@ class dependency_tree:
         new_line = new_line.replace(leaf_path, new_leaf_path)
         # now put macros back in and set the new line in RELEASE
         self.lines[i] = self.replace_macros(new_line, [macro])
+        if self._rev_macros is not None:
+            # move macro to its new value rather than rebuilding the lookup
+            keys = self._rev_macros.get(self.macros[macro], [])
+            if macro in keys:
+                keys.remove(macro)
+                if not keys:
+                    del self._rev_macros[self.macros[macro]]
+            self._rev_macros.setdefault(new_leaf_path, []).append(macro)
         self.macros[macro] = new_leaf_path
 
     def replace_macros(self, line: str, exclude_list: List[str] = []) -> str:
         """Replace macros with ones in self.macros."""  # ?Not sure if this is the case?
-        rev_macros: Dict[str, str] = {}
-        for key in set(self.macros) - set(["TOP"] + exclude_list):
-            if self.macros[key]:
-                rev_macros[self.macros[key]] = "$(" + key + ")"
-        sub_list: List[str] = sorted(list(rev_macros.keys()), key=len, reverse=True)
-        for sub in sub_list:
-            path = line.split("#")[0].split("=")[-1].strip()
-            if sub != path and sub == path[: len(sub)]:
-                line = line.replace(sub, rev_macros[sub])
+        if self._rev_macros is None:
+            self._rev_macros = defaultdict(list)
+            for key, value in self.macros.items():
+                if value:
+                    self._rev_macros[value].append(key)
+        excluded: Set[str] = set(["TOP"] + exclude_list)
+        # only the longest macro value that is a proper prefix of the path
+        # can apply, as once it is replaced the path starts with "$("
+        path = line.partition("#")[0].split("=")[-1].strip()
+        sub: str = ""
+        sub_key: Optional[str] = None
+        for value, keys in self._rev_macros.items():
+            if len(value) > len(sub) and value != path and path.startswith(value):
+                key = next((x for x in keys if x not in excluded), None)
+                if key is not None:
+                    sub, sub_key = value, key
+        if sub_key is not None:
+            line = line.replace(sub, "$(" + sub_key + ")")
         return line
 
 
@@ -558,7 +900,7 @@ def cl_dependency_tree():
         "--newline",
         action="store_true",
         dest="newline",
-        help="Set the separator for the list to be the newline " "character",
+        help="Set the separator for the list to be the newline character",
     )
     (options, args) = parser.parse_args()
     if len(args) != 1:
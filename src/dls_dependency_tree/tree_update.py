@@ -1,10 +1,11 @@
 #!/bin/env dls-python
 """Script to update the dependency tree."""
+
 import os
 import shutil
 from typing import Dict, List, Optional
 
-from .tree import dependency_tree
+from .tree import dependency_tree, parallel_map
 
 
 class dependency_tree_update:
@@ -17,12 +18,18 @@ class dependency_tree_update:
     # new_tree: updated dependency_tree
 
     def __init__(
-        self, tree: dependency_tree, consistent: bool = True, update: bool = True
+        self,
+        tree: dependency_tree,
+        consistent: bool = True,
+        update: bool = True,
+        latest: Optional["dependency_tree_update"] = None,
     ) -> None:
         """Take a dependency_tree and update every module to its latest version.
 
         If consistent is True, it then roll back versions of the updated modules
-        until they form a consistent set
+        until they form a consistent set. If latest is an update of the same
+        tree made with update=True, its updated tree is copied instead of
+        searching for the latest versions again.
         """
         # dict of lists of paths for each module
         # - self.differences[module][0]=old_tree_module.path
@@ -30,7 +37,7 @@ class dependency_tree_update:
         self.differences: Dict[str, List[str]] = {}
         # original dependency_tree object
         self.old_tree: dependency_tree = tree
-        self.strict=self.old_tree.strict
+        self.strict = self.old_tree.strict
         # new updated dependency_tree object
         self.new_tree: dependency_tree = dependency_tree(strict=self.strict)
 
@@ -43,10 +50,17 @@ class dependency_tree_update:
             )
         else:
             self.errorMsg = "Algorithm fails if too many modules are in work"
-        # update to latest version
-        self.find_latest()
-        if update:
-            self.update_tree()
+        if update and latest is not None:
+            # start from an already updated tree
+            self.new_tree = latest.new_tree.copy()
+            self.differences = {
+                name: paths[:] for name, paths in latest.differences.items()
+            }
+        else:
+            # update to latest version
+            self.find_latest()
+            if update:
+                self.update_tree()
         if consistent:
             # try to make a consistent set
             self.make_consistent()
@@ -57,11 +71,14 @@ class dependency_tree_update:
         Print the changes between the RELEASE file of old_tree, and the
         RELEASE file that would be written by new_tree
         """
-        message: str = ""
-        for i, line in enumerate(self.old_tree.lines):
-            new_line = self.new_tree.lines[i]
-            if line != new_line:
-                message += "Change: " + line + "To:     " + new_line
+        # replace_leaf only rewrites lines in place, so the lines pair up
+        message: str = "".join(
+            "Change: " + line + "To:     " + new_line
+            for line, new_line in zip(
+                self.old_tree.lines, self.new_tree.lines, strict=True
+            )
+            if line != new_line
+        )
         print(message)
         return message
 
@@ -77,22 +94,32 @@ class dependency_tree_update:
             os.remove(backup_release)
         shutil.copy(release, backup_release)
         print("Backup written to:", backup_release)
-        file = open(release, "w")
-        file.writelines(self.new_tree.lines)
-        file.close()
+        with open(release, "w") as file:
+            file.write("".join(self.new_tree.lines))
+        dependency_tree.clear_cache()
         print("Changes written to:", release)
 
     def find_latest(self) -> None:
-        """Update new_tree to latest versions of everything."""
-        self.new_tree = self.old_tree.copy()
+        """Update new_tree to latest versions of everything.
+
+        new_tree is only copied from old_tree once an update is found, so it
+        is old_tree itself if there are none.
+        """
+        self.new_tree = self.old_tree
         self.differences = {}
-        for leaf in self.new_tree.leaves:
-            # update each leaf
-            leaf_updates = leaf.updates()
+        # the searches spend most of their time waiting on the filesystem, so
+        # look for the updates of every leaf in parallel
+        all_updates = parallel_map(dependency_tree.updates, self.old_tree.leaves)
+        # a single empty tree, which reads no RELEASE file, is enough to
+        # classify the version of every path. init_version caches each one
+        dummy = dependency_tree(None, strict=self.strict)
+        for i, leaf_updates in enumerate(all_updates):
             if len(leaf_updates) > 1:
+                if self.new_tree is self.old_tree:
+                    self.new_tree = self.old_tree.copy()
+                leaf = self.new_tree.leaves[i]
                 # if there are updates available, add
                 self.differences[leaf.name] = leaf_updates
-                dummy = dependency_tree(None, strict=self.strict)
                 leaf.versions = []
                 for path in leaf_updates:
                     dummy.path = path
@@ -101,12 +128,17 @@ class dependency_tree_update:
 
     def update_tree(self) -> None:
         """Update new_tree to latest versions of everything."""
-        for leaf in self.new_tree.leaves:
-            if leaf.name in self.differences:
-                new_leaf = dependency_tree(leaf.parent, self.differences[leaf.name][-1],
-                                           strict=self.strict)
-                new_leaf.versions = leaf.versions
-                self.new_tree.replace_leaf(leaf, new_leaf)
+        leaves = [x for x in self.new_tree.leaves if x.name in self.differences]
+
+        def make_leaf(leaf: dependency_tree) -> dependency_tree:
+            return dependency_tree(
+                leaf.parent, self.differences[leaf.name][-1], strict=self.strict
+            )
+
+        # make the updated subtrees in parallel, then swap them in one by one
+        for leaf, new_leaf in zip(leaves, parallel_map(make_leaf, leaves), strict=True):
+            new_leaf.versions = leaf.versions
+            self.new_tree.replace_leaf(leaf, new_leaf)
 
     def make_consistent(self) -> None:
         """Roll back the changes we made in update_tree() until it is consistent."""
@@ -114,12 +146,13 @@ class dependency_tree_update:
             print_warnings=False
         )
         agenda: Optional[dependency_tree] = None
+        first: List[dependency_tree] = []
         lasti: int = -1
         print("Making a consistent set of releases, press Ctrl-C to interrupt...")
         while clashes:
             if agenda:
                 assert agenda.parent, "Module has no parent: " + str(agenda)
-                if agenda.parent == self.new_tree:
+                if agenda.parent is self.new_tree:
                     # if the module is listed directly in this tree, try to revert
                     try:
                         self.__revert(agenda)
@@ -127,18 +160,19 @@ class dependency_tree_update:
                         agenda = None
                     except AssertionError:
                         lasti -= 1
-                        if len(clashes[list(clashes.keys())[0]]) + lasti < 0:
+                        if len(first) + lasti < 0:
                             raise
                         else:
-                            agenda = clashes[list(clashes.keys())[0]][lasti]
+                            agenda = first[lasti]
                 else:
                     # keep stepping up the tree until we find a module we are
                     # allowed to revert
                     agenda = agenda.parent
             else:
-                # pick the next module to revert
+                # pick the next module to revert from the first clash
                 lasti = -1
-                agenda = clashes[list(clashes.keys())[0]][-1]
+                first = clashes[next(iter(clashes))]
+                agenda = first[-1]
         print("Done")
 
     def __revert(self, leaf: dependency_tree) -> None:
@@ -146,10 +180,11 @@ class dependency_tree_update:
         assert leaf.name in self.differences, (
             "Cannot revert module: " + leaf.name + "\n" + self.errorMsg
         )
+        # each update owns its lists of paths, so step back in place
         paths = self.differences[leaf.name]
-        new_leaf_path = paths[-2]
-        self.differences[leaf.name] = paths[:-1]
-        if len(paths) < 3:
+        paths.pop()
+        new_leaf_path = paths[-1]
+        if len(paths) < 2:
             del self.differences[leaf.name]
         new_leaf = dependency_tree(leaf.parent, new_leaf_path, strict=self.strict)
         print(
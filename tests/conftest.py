@@ -1,4 +1,7 @@
 import os
+import re
+import sys
+import types
 from typing import Any
 
 import pytest
@@ -19,3 +22,129 @@ if os.getenv("PYTEST_RAISE", "0") == "1":
     @pytest.hookimpl(tryfirst=True)
     def pytest_internalerror(excinfo: pytest.ExceptionInfo[Any]):
         raise excinfo.value
+
+
+EPICS = "R3.14.12.7"
+
+
+class FakeEnvironment:
+    """The parts of dls_ade.dls_environment.environment used by the tree.
+
+    Work and prod areas are under root, which is set by the support fixture.
+    """
+
+    root = ""
+    epics_ver_re = re.compile(r"R\d(\.\d+)+")
+
+    def __init__(self):
+        self.epics = EPICS
+
+    def copy(self):
+        e = FakeEnvironment()
+        e.epics = self.epics
+        return e
+
+    def epicsVer(self):
+        return self.epics
+
+    def setEpics(self, epics):
+        self.epics = epics
+
+    def devArea(self, area="support"):
+        return os.path.join(self.root, "work", self.epics, area)
+
+    def prodArea(self, area="support"):
+        return os.path.join(self.root, "prod", self.epics, area)
+
+    def classifyPath(self, path):
+        prod = self.prodArea() + "/"
+        if path.startswith(prod):
+            name, _, version = path[len(prod) :].partition("/")
+            return name, version
+        if path.startswith(self.devArea() + "/"):
+            return os.path.basename(path), "work"
+        return os.path.basename(path), "local"
+
+    def sortReleases(self, paths):
+        def key(path):
+            if isinstance(path, tuple):
+                path = path[0]
+            version = os.path.basename(path)
+            return [int(x) if x.isdigit() else -1 for x in re.split(r"[-.]", version)]
+
+        return sorted(paths, key=key)
+
+
+try:
+    import dls_ade.dls_environment
+except ImportError:
+    # only the environment class is used, which the tests replace anyway
+    dls_ade = types.ModuleType("dls_ade")
+    dls_ade.dls_environment = types.ModuleType("dls_ade.dls_environment")
+    dls_ade.dls_environment.environment = FakeEnvironment
+    sys.modules["dls_ade"] = dls_ade
+    sys.modules["dls_ade.dls_environment"] = dls_ade.dls_environment
+
+from dls_dependency_tree.tree import dependency_tree  # noqa: E402
+
+
+def make_module(path, lines):
+    os.makedirs(os.path.join(path, "configure"), exist_ok=True)
+    with open(os.path.join(path, "configure", "RELEASE"), "w") as f:
+        f.writelines(line + "\n" for line in lines)
+    return path
+
+
+@pytest.fixture
+def support(tmp_path, monkeypatch):
+    """Make a prod support area of modules, returning its path."""
+    monkeypatch.setattr(FakeEnvironment, "root", str(tmp_path))
+    monkeypatch.setattr(dls_ade.dls_environment, "environment", FakeEnvironment)
+    dependency_tree.clear_cache()
+    support = FakeEnvironment().prodArea()
+    header = ["SUPPORT=" + support, f"EPICS_BASE=/dls_sw/epics/{EPICS}/base"]
+    for version in ["4-1", "4-2", "4-3"]:
+        make_module(os.path.join(support, "asyn", version), header)
+    for version, asyn in [("1-1", "4-1"), ("1-2", "4-2")]:
+        make_module(
+            os.path.join(support, "busy", version),
+            header + ["ASYN=$(SUPPORT)/asyn/" + asyn],
+        )
+    for version, asyn, busy in [("6-1", "4-1", "1-1"), ("6-2", "4-2", "1-2")]:
+        make_module(
+            os.path.join(support, "motor", version),
+            header + ["ASYN=$(SUPPORT)/asyn/" + asyn, "BUSY=$(SUPPORT)/busy/" + busy],
+        )
+    # asyn appears twice in the subtree of motor 6-2, the only leaf of pva
+    for version in ["1-1", "1-2"]:
+        make_module(
+            os.path.join(support, "pva", version),
+            header + ["MOTOR=$(SUPPORT)/motor/6-2"],
+        )
+    make_module(os.path.join(support, "calc", "3-1"), header)
+    # a module with no updates whose leaves have none either
+    make_module(
+        os.path.join(support, "stream", "2-1"), header + ["ASYN=$(SUPPORT)/asyn/4-3"]
+    )
+    yield support
+    dependency_tree.clear_cache()
+
+
+@pytest.fixture
+def make_top(support):
+    """Return a function making a work area module from RELEASE lines.
+
+    The lines are written after a definition of SUPPORT.
+    """
+
+    def make_top(lines):
+        path = os.path.join(FakeEnvironment().devArea(), "top")
+        return make_module(path, ["SUPPORT=" + support] + lines)
+
+    return make_top
+
+
+@pytest.fixture
+def tree(make_top):
+    top = make_top(["MOTOR=$(SUPPORT)/motor/6-1", "ASYN=$(SUPPORT)/asyn/4-1"])
+    return dependency_tree(None, top)
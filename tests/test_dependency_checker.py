@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import Qt  # noqa: E402
+from PyQt5.QtWidgets import QApplication, QTreeWidgetItem  # noqa: E402
+
+from dls_dependency_tree.dependency_checker import (  # noqa: E402
+    _FG_CAUSE,
+    _FG_CLASH,
+    TreeView,
+    reverter,
+    update_thread,
+)
+from dls_dependency_tree.tree import dependency_tree  # noqa: E402
+from dls_dependency_tree.tree_update import dependency_tree_update  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def gui_items(view):
+    """Return every item in view, parents before their children."""
+    items = []
+    stack = [view.topLevelItem(i) for i in range(view.topLevelItemCount())]
+    while stack:
+        item = stack.pop()
+        items.append(item)
+        stack += [item.child(i) for i in range(item.childCount())]
+    return items
+
+
+def test_children_are_made_when_expanded(app, make_top):
+    # nothing below stream needs opening, so its items wait to be expanded
+    top = make_top(["STREAM=$(SUPPORT)/stream/2-1", "ASYN=$(SUPPORT)/asyn/4-3"])
+    view = TreeView(dependency_tree(None, top), "original")
+    stream = view.topLevelItem(0).child(0)
+    assert stream.text(0) == "stream: 2-1"
+    assert not stream.populated
+    assert stream.childCount() == 0
+    assert stream.childIndicatorPolicy() == QTreeWidgetItem.ShowIndicator
+    stream.setExpanded(True)
+    assert stream.populated
+    assert [stream.child(i).text(0) for i in range(stream.childCount())] == [
+        "asyn: 4-3"
+    ]
+    assert view.item_for[id(stream.tree.leaves[0])] is stream.child(0)
+
+
+@pytest.fixture
+def consistent_view(app, tree):
+    # motor 6-2 and asyn 4-2, with asyn 4-3 as a later version to change to
+    return TreeView(dependency_tree_update(tree).new_tree, "consistent")
+
+
+def test_revert_replaces_only_its_item(consistent_view, support):
+    root = consistent_view.topLevelItem(0)
+    motor, asyn = root.child(0), root.child(1)
+    path = os.path.join(support, "motor", "6-1")
+    reverter(motor.tree, consistent_view, path).revert()
+    assert root.childCount() == 2
+    assert root.child(0) is not motor
+    assert root.child(0).text(0) == "motor: 6-1"
+    assert root.child(1) is asyn
+    # only items still in the view are registered
+    assert {id(x.tree) for x in gui_items(consistent_view)} == set(
+        consistent_view.item_for
+    )
+
+
+def test_revert_forgets_every_replaced_item(app, make_top, support):
+    top = make_top(["PVA=$(SUPPORT)/pva/1-1"])
+    view = TreeView(dependency_tree_update(dependency_tree(None, top)).new_tree, "")
+    pva = view.topLevelItem(0).child(0)
+    assert pva.text(0) == "pva: 1-2"
+    reverter(pva.tree, view, os.path.join(support, "pva", "1-1")).revert()
+    assert {id(x.tree) for x in gui_items(view)} == set(view.item_for)
+
+
+def test_revert_recolours_clashes(consistent_view, support):
+    root = consistent_view.topLevelItem(0)
+    motor, asyn = root.child(0), root.child(1)
+    motor_asyn = consistent_view.item_for[id(motor.tree.leaves[0])]
+    assert motor_asyn.text(0) == "asyn: 4-2"
+    assert motor_asyn.foreground(0).color() != _FG_CAUSE.color()
+    reverter(asyn.tree, consistent_view, os.path.join(support, "asyn", "4-3")).revert()
+    # the asyn 4-2 under motor now clashes with the later asyn 4-3
+    assert motor_asyn.foreground(0).color() == _FG_CAUSE.color()
+    assert root.child(1).foreground(0).color() == _FG_CLASH.color()
+
+
+def test_update_thread_never_emits_its_own_tree(app, make_top):
+    # with no updates every loc's new tree would be the original one
+    top = make_top(["STREAM=$(SUPPORT)/stream/2-1", "ASYN=$(SUPPORT)/asyn/4-3"])
+    tree = dependency_tree(None, top)
+    thread = update_thread(tree)
+    emitted = []
+    thread.updateReady.connect(lambda *args: emitted.append(args), Qt.DirectConnection)
+    thread.run()
+    assert [(loc, error) for loc, _, error in emitted] == [
+        ("original", ""),
+        ("latest", ""),
+        ("consistent", ""),
+    ]
+    for _, update, _ in emitted:
+        assert update.new_tree == tree
+        assert update.new_tree is not tree
@@ -0,0 +1,12 @@
+from dls_dependency_tree import ioc_build
+
+
+def test_missing_command_fails_the_build(tmp_path, monkeypatch, capsys):
+    commands = [["dls-no-such-command"], ["true"]]
+    monkeypatch.setattr(
+        ioc_build, "prepare_build", lambda release_path: (str(tmp_path), commands)
+    )
+    ioc_build.build_ioc("RELEASE")
+    assert capsys.readouterr().out.endswith(
+        "Failed to build IOC: dls-no-such-command\n"
+    )
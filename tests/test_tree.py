@@ -0,0 +1,266 @@
+import os
+import threading
+import time
+
+from dls_dependency_tree.tree import dependency_tree, parallel_map
+from dls_dependency_tree.tree_update import dependency_tree_update
+
+
+def leaf_versions(tree):
+    return [(x.name, x.version) for x in tree.leaves]
+
+
+def test_macro_chain_deeper_than_five(support, make_top):
+    # each macro refers to one defined after it, so it takes one pass per link
+    # if they are substituted in file order
+    chain = ["ASYN=$(A8)/asyn/4-1"]
+    chain += [f"A{i}=$(A{i - 1})" for i in range(8, 1, -1)]
+    chain += ["A1=$(SUPPORT)"]
+    tree = dependency_tree(None, make_top(chain))
+    assert tree.macros["ASYN"] == os.path.join(support, "asyn", "4-1")
+    assert leaf_versions(tree) == [("asyn", "4-1")]
+
+
+def test_brace_and_bare_macros(support, make_top):
+    top = make_top(["ASYN=${SUPPORT}/asyn/4-2", "BUSY=$SUPPORT/busy/1-1"])
+    tree = dependency_tree(None, top)
+    assert tree.macros["ASYN"] == os.path.join(support, "asyn", "4-2")
+    assert tree.macros["BUSY"] == os.path.join(support, "busy", "1-1")
+    assert leaf_versions(tree) == [("asyn", "4-2"), ("busy", "1-1")]
+
+
+def test_unknown_macros_are_empty(support, make_top):
+    top = make_top(["ASYN=$(SUPPORT)$(NOT_DEFINED)/asyn/4-1"])
+    tree = dependency_tree(None, top)
+    assert tree.macros["ASYN"] == os.path.join(support, "asyn", "4-1")
+    assert leaf_versions(tree) == [("asyn", "4-1")]
+
+
+def test_macro_cycles_stop(support, make_top):
+    top = make_top(["A=$(B)/a", "B=$(A)/b", "ASYN=$(SUPPORT)/asyn/4-1"])
+    tree = dependency_tree(None, top, warnings=False)
+    assert "$(" in tree.macros["A"]
+    assert "$(" in tree.macros["B"]
+    assert tree.macros["ASYN"] == os.path.join(support, "asyn", "4-1")
+
+
+def test_flatten_removes_dups(tree):
+    assert [(x.name, x.version) for x in tree.flatten()] == [
+        ("asyn", "4-1"),
+        ("busy", "1-1"),
+        ("motor", "6-1"),
+        ("top", "work"),
+    ]
+
+
+def test_flatten_keeps_dups_between_leaves(tree):
+    # duplicates are only removed within the subtree of each leaf
+    assert [(x.name, x.version) for x in tree.flatten(remove_dups=False)] == [
+        ("asyn", "4-1"),
+        ("busy", "1-1"),
+        ("motor", "6-1"),
+        ("asyn", "4-1"),
+        ("top", "work"),
+    ]
+
+
+def test_cached_subtrees_match_fresh_ones(tree):
+    cached = dependency_tree(None, tree.path)
+    dependency_tree.clear_cache()
+    fresh = dependency_tree(None, tree.path)
+    assert cached == fresh
+    for a, b in zip(
+        cached.flatten(remove_dups=False), fresh.flatten(remove_dups=False), strict=True
+    ):
+        assert a.path == b.path
+        assert a.macros == b.macros
+        assert a.lines == b.lines
+    # the cached subtrees belong to the tree that asked for them
+    for parent in cached.flatten(remove_dups=False):
+        assert all(leaf.parent is parent for leaf in parent.leaves)
+
+
+def test_latest_changes(tree):
+    update = dependency_tree_update(tree, consistent=False)
+    assert leaf_versions(update.new_tree) == [("motor", "6-2"), ("asyn", "4-3")]
+    assert update.print_changes() == (
+        "Change: MOTOR=$(SUPPORT)/motor/6-1\n"
+        "To:     MOTOR=$(SUPPORT)/motor/6-2\n"
+        "Change: ASYN=$(SUPPORT)/asyn/4-1\n"
+        "To:     ASYN=$(SUPPORT)/asyn/4-3\n"
+    )
+
+
+def test_consistent_changes(tree):
+    # motor 6-2 needs asyn 4-2, so asyn is rolled back from the latest 4-3
+    update = dependency_tree_update(tree)
+    assert leaf_versions(update.new_tree) == [("motor", "6-2"), ("asyn", "4-2")]
+    assert not update.new_tree.clashes(print_warnings=False)
+    assert update.print_changes() == (
+        "Change: MOTOR=$(SUPPORT)/motor/6-1\n"
+        "To:     MOTOR=$(SUPPORT)/motor/6-2\n"
+        "Change: ASYN=$(SUPPORT)/asyn/4-1\n"
+        "To:     ASYN=$(SUPPORT)/asyn/4-2\n"
+    )
+
+
+def test_parallel_map_runs_together_in_order():
+    # every call has to be running before any of them can return
+    barrier = threading.Barrier(4, timeout=5)
+
+    def double(x):
+        barrier.wait()
+        time.sleep(0.01 * (4 - x))
+        return x * 2
+
+    assert parallel_map(double, range(4)) == [0, 2, 4, 6]
+
+
+def test_top_level_leaves_built_together_in_order(monkeypatch, make_top):
+    # each leaf of the top module waits until all three are being made
+    barrier = threading.Barrier(3, timeout=5)
+    process_module = dependency_tree.process_module
+
+    def wait_for_siblings(self, module_path):
+        if self.parent is not None and self.parent.parent is None:
+            barrier.wait()
+        process_module(self, module_path)
+
+    monkeypatch.setattr(dependency_tree, "process_module", wait_for_siblings)
+    top = make_top(
+        [
+            "MOTOR=$(SUPPORT)/motor/6-1",
+            "ASYN=$(SUPPORT)/asyn/4-1",
+            "BUSY=$(SUPPORT)/busy/1-1",
+        ],
+    )
+    tree = dependency_tree(None, top)
+    assert leaf_versions(tree) == [("motor", "6-1"), ("asyn", "4-1"), ("busy", "1-1")]
+
+
+def test_indented_includes_and_spaced_defines(support, tmp_path, make_top):
+    calc = os.path.join(support, "calc", "3-1")
+    included = tmp_path / "included"
+    included.write_text(f"CALC   =   {calc}  \n")
+    missing = tmp_path / "missing"
+    top = make_top(
+        [
+            f"  include   {included}",
+            f"-include {missing}",
+            "ASYN = $(SUPPORT)/asyn/4-1 # comment",
+        ],
+    )
+    tree = dependency_tree(None, top)
+    assert tree.macros["CALC"] == calc
+    assert tree.macros["ASYN"] == os.path.join(support, "asyn", "4-1")
+    assert leaf_versions(tree) == [("calc", "3-1"), ("asyn", "4-1")]
+
+
+def test_revert_steps_back_paths_in_place(tree, support):
+    update = dependency_tree_update(tree, consistent=False)
+    paths = update.differences["asyn"]
+    update.make_consistent()
+    assert update.differences["asyn"] is paths
+    assert paths == [os.path.join(support, "asyn", v) for v in ["4-1", "4-2"]]
+
+
+def test_clash_order_is_remembered(support, monkeypatch, make_top):
+    top = make_top(["MOTOR=$(SUPPORT)/motor/6-1", "ASYN=$(SUPPORT)/asyn/4-2"])
+    tree = dependency_tree(None, top)
+    sorts = []
+    sort_releases = tree.e.sortReleases
+
+    def counted_sort(paths):
+        sorts.append(paths)
+        return sort_releases(paths)
+
+    monkeypatch.setattr(tree.e, "sortReleases", counted_sort)
+    first = tree.clashes(print_warnings=False)
+    second = tree.clashes(print_warnings=False)
+    assert [x.version for x in first["asyn"]] == ["4-1", "4-2"]
+    assert second == first
+    assert second["asyn"] is not first["asyn"]
+    # the same group of leaves is only sorted once
+    assert len(sorts) == 1
+    # names that no longer clash are forgotten
+    asyn = dependency_tree(tree, os.path.join(support, "asyn", "4-1"))
+    tree.replace_leaf(tree.leaves[1], asyn)
+    assert tree.clashes(print_warnings=False) == {}
+    assert tree._clash_order == {}
+
+
+def test_no_updates_keeps_the_original_tree(make_top):
+    top = make_top(["STREAM=$(SUPPORT)/stream/2-1", "ASYN=$(SUPPORT)/asyn/4-3"])
+    tree = dependency_tree(None, top)
+    update = dependency_tree_update(tree, consistent=False, update=False)
+    assert update.new_tree is tree
+    assert update.differences == {}
+
+
+def test_updates_leave_the_original_tree_alone(tree):
+    update = dependency_tree_update(tree, consistent=False, update=False)
+    assert update.new_tree is not tree
+    assert leaf_versions(tree) == [("motor", "6-1"), ("asyn", "4-1")]
+    assert [x.versions for x in tree.leaves] == [[], []]
+
+
+def count_made_modules(monkeypatch):
+    """Return a list that gets the path of each module made from its files."""
+    made = []
+    process_module = dependency_tree.process_module
+
+    def counted(self, module_path):
+        made.append(module_path)
+        process_module(self, module_path)
+
+    monkeypatch.setattr(dependency_tree, "process_module", counted)
+    return made
+
+
+def test_subtrees_are_reused(tree, monkeypatch):
+    made = count_made_modules(monkeypatch)
+    again = dependency_tree(None, tree.path)
+    assert again == tree
+    # only the top module is read again, its leaves are copied
+    assert made == [tree.path]
+    assert all(leaf.parent is again for leaf in again.leaves)
+
+
+def test_subtrees_are_made_again_after_edits(tree, support, monkeypatch):
+    # busy is a leaf of motor, and motor 6-1 is a leaf of the top module
+    with open(os.path.join(support, "busy", "1-1", "configure", "RELEASE"), "w") as f:
+        f.write(f"# edited\nSUPPORT={support}\nASYN=$(SUPPORT)/asyn/4-2\n")
+    made = count_made_modules(monkeypatch)
+    again = dependency_tree(None, tree.path)
+    busy = again.leaves[0].leaves[1]
+    assert (busy.name, busy.version) == ("busy", "1-1")
+    assert leaf_versions(busy) == [("asyn", "4-2")]
+    # the asyn leaf of motor is unchanged, so it is still copied
+    assert made == [
+        tree.path,
+        os.path.join(support, "motor", "6-1"),
+        os.path.join(support, "busy", "1-1"),
+        os.path.join(support, "asyn", "4-2"),
+    ]
+
+
+def test_subtrees_are_made_again_after_include_edits(make_top, support, tmp_path):
+    included = tmp_path / "included"
+    included.write_text("ASYN=$(SUPPORT)/asyn/4-1\n")
+    inc = os.path.join(support, "inc", "1-0")
+    os.makedirs(os.path.join(inc, "configure"))
+    with open(os.path.join(inc, "configure", "RELEASE"), "w") as f:
+        f.write(f"SUPPORT={support}\ninclude {included}\n")
+    top = make_top(["INC=$(SUPPORT)/inc/1-0"])
+    assert leaf_versions(dependency_tree(None, top).leaves[0]) == [("asyn", "4-1")]
+    included.write_text("\nASYN=$(SUPPORT)/asyn/4-2\n")
+    assert leaf_versions(dependency_tree(None, top).leaves[0]) == [("asyn", "4-2")]
+
+
+def test_new_releases_are_updates(tree, support):
+    asyn = tree.leaves[1]
+    versions = [os.path.join(support, "asyn", v) for v in ["4-1", "4-2", "4-3"]]
+    assert asyn.updates() == versions
+    # a release made while the tree is in use is found without clearing caches
+    os.makedirs(os.path.join(support, "asyn", "4-4", "configure"))
+    assert asyn.updates() == versions + [os.path.join(support, "asyn", "4-4")]